@@ -5,8 +5,15 @@ A package for parsing and evaluating boolean text queries with support for
 AND, OR, NOT operations, parentheses for nested expressions, and regular expressions.
 """
 
-from boolean_query_parser.parser import QueryError, apply_query, parse_query
+from boolean_query_parser.parser import (
+    DocumentIndex,
+    QueryError,
+    apply_query,
+    apply_query_iter,
+    compile_query,
+    parse_query,
+)
 
 __version__ = "1.0.3"
-__all__ = ['parse_query', 'apply_query', 'QueryError']
+__all__ = ['parse_query', 'apply_query', 'apply_query_iter', 'compile_query', 'DocumentIndex', 'QueryError']
 
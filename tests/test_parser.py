@@ -6,9 +6,21 @@ These tests cover basic operations (AND, OR, NOT), complex nested expressions,
 regex matching, and edge cases like empty queries and syntax errors.
 """
 
+import re
+import sys
 import unittest
+import warnings
+from unittest import mock
 
-from boolean_query_parser import QueryError, apply_query, parse_query
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+from boolean_query_parser import DocumentIndex, QueryError, apply_query, apply_query_iter, compile_query, parse_query
+from boolean_query_parser.parser import (
+    AndNode, Lexer, NotNode, OrNode, RegexNode, TextNode, TokenType, _compile_regex,
+)
 
 
 class TestBooleanQueryParser(unittest.TestCase):
@@ -220,6 +232,16 @@ class TestBooleanQueryParser(unittest.TestCase):
 class TestRegexFeatures(unittest.TestCase):
     """Test cases specifically focusing on regex pattern matching capabilities."""
 
+    def test_regex_compiled_once_at_parse_time(self):
+        """Evaluating a parsed query never compiles or looks up a pattern again."""
+        query = parse_query("/py.*on/i AND NOT /diff[a-z]+/ OR /^\\d{3}$/m")
+        texts = ["Python is easy", "python is difficult", "123", "none"]
+        expected = [t for t in texts if query.evaluate(t)]
+        with mock.patch.object(re, "compile", side_effect=AssertionError("recompiled")), \
+             mock.patch.object(re, "search", side_effect=AssertionError("re.search")):
+            self.assertEqual([t for t in texts if apply_query(query, t)], expected)
+            self.assertEqual(apply_query(query, texts), expected)
+
     def test_basic_regex_patterns(self):
         """Test basic regex pattern matching."""
         # Simple word pattern with case insensitive flag
@@ -373,6 +395,17 @@ class TestImplicitAND(unittest.TestCase):
         self.assertFalse(apply_query(query, "error: permission denied"))
         self.assertFalse(apply_query(query, "success"))
 
+    def test_operand_starting_tokens_are_numbered_first(self):
+        """The parser detects implicit AND by comparing token types to NOT."""
+        starters = {TokenType.TEXT, TokenType.REGEX, TokenType.LPAREN, TokenType.NOT}
+        self.assertEqual({t for t in TokenType if t <= TokenType.NOT}, starters)
+
+    def test_implicit_and_before_parenthesis_and_regex(self):
+        """Parentheses and regexes after an operand also start an implicit AND."""
+        query = parse_query("error (disk OR cpu) /\\d+%/")
+        self.assertTrue(apply_query(query, "error: cpu at 99%"))
+        self.assertFalse(apply_query(query, "error: cpu at max"))
+
     def test_implicit_and_three_terms(self):
         """Test implicit AND with three adjacent terms."""
         query = parse_query("python web framework")
@@ -529,6 +562,45 @@ class TestReadmeExamples(unittest.TestCase):
 class TestEdgeCases(unittest.TestCase):
     """Additional edge case tests."""
 
+    def test_whitespace_around_tokens(self):
+        """Tabs, newlines and trailing whitespace only separate tokens."""
+        query = parse_query("\t python\n\r AND\n(java OR  go )  \n")
+        self.assertEqual(repr(query), "(Text('python') AND (Text('go') OR Text('java')))")
+
+    def test_token_positions_are_kept_beside_tokens(self):
+        """Lexer.positions holds the query offset of the token at each index."""
+        lexer = Lexer('a AND ("b c" OR /d/i)')
+        tokens = lexer.tokenize()
+        self.assertEqual([t[0] for t in tokens], [
+            TokenType.TEXT, TokenType.AND, TokenType.LPAREN, TokenType.TEXT,
+            TokenType.OR, TokenType.REGEX, TokenType.RPAREN, TokenType.EOF,
+        ])
+        self.assertEqual(lexer.positions, [0, 2, 6, 7, 13, 16, 20, 21])
+
+    def test_regex_flags_stop_before_numerals(self):
+        """Only letters after the closing slash are flags; a numeral starts the next word."""
+        lexer = Lexer("/a/g\u00b2_3 /b/\u216bx")
+        tokens = lexer.tokenize()
+        self.assertEqual(tokens[:-1], [
+            (TokenType.REGEX, "a/g"), (TokenType.TEXT, "\u00b2_3"),
+            (TokenType.REGEX, "b"), (TokenType.TEXT, "\u216bx"),
+        ])
+        self.assertEqual(lexer.positions, [0, 4, 8, 11, 13])
+        with self.assertRaisesRegex(QueryError, "Unclosed regex at position 2"):
+            parse_query("//\u216b")
+
+    def test_error_positions_skip_leading_whitespace(self):
+        """Error positions point at the offending character, not the space before it."""
+        with self.assertRaisesRegex(QueryError, "position 5"):
+            parse_query("  a  )")
+        with self.assertRaisesRegex(QueryError, "Unrecognized character '\x0c' at position 4"):
+            parse_query("a   \x0cb")
+
+    def test_query_nested_too_deeply(self):
+        """Nesting beyond the interpreter's recursion limit is a QueryError."""
+        with self.assertRaisesRegex(QueryError, "nested too deeply"):
+            parse_query("(" * 5000 + "x" + ")" * 5000)
+
     def test_standalone_not(self):
         """Test NOT as the only operator (without AND/OR)."""
         query = parse_query("NOT python")
@@ -787,6 +859,21 @@ class TestStressAndNasty(unittest.TestCase):
         text_no_match = "greeting\nbeautiful\nearth"
         self.assertFalse(apply_query(query, text_no_match))
 
+    def test_regex_flag_letters_map_to_re_flags(self):
+        """Each flag letter sets its re flag; repeated letters are harmless."""
+        query = parse_query("/a b/xsi")
+        self.assertEqual(query.regex.pattern, "a b")
+        self.assertTrue(query.regex.flags & re.VERBOSE)
+        self.assertTrue(query.regex.flags & re.DOTALL)
+        self.assertTrue(query.regex.flags & re.IGNORECASE)
+        self.assertFalse(query.regex.flags & re.MULTILINE)
+        self.assertEqual(parse_query("/abc/ii").regex.flags, parse_query("/abc/i").regex.flags)
+
+    def test_flag_letter_order_does_not_matter(self):
+        """/p/im and /p/mi compile to the same regex object."""
+        self.assertIs(parse_query("/a.c/im").regex, parse_query("/a.c/mi").regex)
+        self.assertIs(parse_query("/a.c/xsmi").regex, parse_query("/a.c/imsx").regex)
+
     def test_regex_with_escaped_slashes_in_pattern(self):
         """Regex containing escaped forward slashes (previous bug area)."""
         query = parse_query('/a\\/b\\/c/')
@@ -842,6 +929,15 @@ class TestStressAndNasty(unittest.TestCase):
         self.assertTrue(apply_query(query, "this NOT that"))
         self.assertFalse(apply_query(query, "this with that"))
 
+    def test_words_starting_with_operator_keywords_are_text(self):
+        """Only whole words spell operators, in any letter case."""
+        query = parse_query("android oR notation anD order_id")
+        self.assertIsInstance(query, OrNode)
+        self.assertEqual(repr(query.children[0]), "Text('android')")
+        self.assertTrue(apply_query(query, "notation for order_id"))
+        self.assertFalse(apply_query(query, "notation only"))
+        self.assertEqual(repr(parse_query("nOt and1")), "NOT(Text('and1'))")
+
     def test_quoted_and_between_terms(self):
         """'x "AND" y' should be implicit AND of three text nodes."""
         query = parse_query('python "AND" java')
@@ -856,6 +952,15 @@ class TestStressAndNasty(unittest.TestCase):
         self.assertTrue(apply_query(query, 'say "hello"'))
         self.assertFalse(apply_query(query, 'say hello'))
 
+    def test_quoted_string_escape_sequences(self):
+        """Backslash keeps the next character; long unescaped bodies are kept verbatim."""
+        self.assertEqual(parse_query('"a\\\\b"').value, "a\\b")
+        self.assertEqual(parse_query('"\\x\\y"').value, "xy")
+        self.assertEqual(parse_query("'it\\'s'").value, "it's")
+        self.assertEqual(parse_query('"tail\\\\').value, "tail\\")
+        long_body = "word " * 2000
+        self.assertEqual(parse_query(f'"{long_body}"').value, long_body)
+
     # ── Semver / release-notes style complex query ────────────────────
 
     def test_semver_changelog_filter(self):
@@ -1031,6 +1136,18 @@ class TestStressAndNasty(unittest.TestCase):
         with self.assertRaises(QueryError):
             parse_query("/[invalid(/")
 
+    def test_exponential_backtracking_regexes_are_rejected(self):
+        """Nested repeats that can match the same text in many ways raise QueryError."""
+        for pattern in ["(a+)+$", "(a*)*b", "(\\w+\\s?)+$", "(a|a)*$", "x (?:(\\d+))+ y"]:
+            with self.assertRaises(QueryError, msg=pattern) as cm:
+                parse_query(f"/{pattern}/")
+            self.assertIn("exponential", str(cm.exception))
+
+    def test_nested_repeats_with_a_separator_are_accepted(self):
+        """Repeats whose iterations cannot overlap still parse."""
+        for pattern in ["([a-z]+\\.)+com", "(ab+)+", "(a|b)*", "(\\d{1,3}\\.){3}\\d+"]:
+            self.assertTrue(apply_query(parse_query(f"/{pattern}/"), "x ab abb. 1.2.3.4 a.b.com"), msg=pattern)
+
     def test_text_data_type_validation(self):
         """Passing wrong type to apply_query should raise TypeError."""
         query = parse_query("test")
@@ -1102,6 +1219,760 @@ class TestStressAndNasty(unittest.TestCase):
                 )
 
 
+class TestParseCache(unittest.TestCase):
+    """Tests for the LRU cache in front of parse_query."""
+
+    def setUp(self):
+        parse_query.cache_clear()
+
+    def test_repeated_query_returns_same_ast(self):
+        """Parsing the same string twice returns the cached AST object."""
+        first = parse_query("python AND (django OR flask)")
+        second = parse_query("python AND (django OR flask)")
+        self.assertIs(first, second)
+        self.assertEqual(parse_query.cache_info().hits, 1)
+
+    def test_different_queries_are_cached_separately(self):
+        """Distinct query strings get distinct ASTs."""
+        self.assertIsNot(parse_query("python"), parse_query("java"))
+
+    def test_errors_are_not_cached(self):
+        """Invalid queries raise every time and never populate the cache."""
+        for _ in range(2):
+            with self.assertRaises(QueryError):
+                parse_query("python AND")
+        self.assertEqual(parse_query.cache_info().currsize, 0)
+
+    def test_argument_spelling_shares_one_entry(self):
+        """Positional, keyword and default engine arguments hit the same entry."""
+        ast = parse_query("python")
+        self.assertIs(parse_query("python", "re"), ast)
+        self.assertIs(parse_query("python", engine="re"), ast)
+        self.assertIs(parse_query(query_str="python"), ast)
+        self.assertEqual(parse_query.cache_info().currsize, 1)
+
+    def test_identical_terms_share_leaf_nodes(self):
+        """The same term or regex in different queries is one shared node."""
+        first = parse_query("python AND /\\d+/")
+        second = parse_query("/\\d+/ OR python OR java")
+        self.assertEqual(len({id(leaf) for leaf in first.children + second.children}), 3)
+
+    def test_cache_clear(self):
+        """cache_clear() drops previously parsed ASTs."""
+        first = parse_query("python")
+        parse_query.cache_clear()
+        self.assertIsNot(first, parse_query("python"))
+
+    def test_cache_clear_drops_compiled_regexes(self):
+        """cache_clear() also releases compiled regexes, which are otherwise shared."""
+        parse_query("/\\d{4}/ OR /x+/")
+        self.assertEqual(_compile_regex.cache_info().currsize, 2)
+        parse_query.cache_clear()
+        self.assertEqual(_compile_regex.cache_info().currsize, 0)
+
+
+class TestNaryNodes(unittest.TestCase):
+    """Tests for flattening AND/OR chains into n-ary nodes."""
+
+    def test_implicit_and_chain_is_one_node(self):
+        """A chain of implicit ANDs builds a single AndNode."""
+        ast = parse_query("a b c d e")
+        self.assertIsInstance(ast, AndNode)
+        self.assertEqual([c.value for c in ast.children], ["a", "b", "c", "d", "e"])
+
+    def test_or_chain_is_one_node(self):
+        """A chain of ORs builds a single OrNode."""
+        ast = parse_query("a OR b OR c")
+        self.assertIsInstance(ast, OrNode)
+        self.assertEqual(len(ast.children), 3)
+
+    def test_parenthesized_groups_of_same_operator_are_spliced(self):
+        """Same-operator groups are merged into their parent."""
+        ast = parse_query("(a AND b) AND (c AND d)")
+        self.assertIsInstance(ast, AndNode)
+        self.assertEqual(len(ast.children), 4)
+
+        ast = parse_query("a OR (b OR (c OR d))")
+        self.assertIsInstance(ast, OrNode)
+        self.assertEqual(len(ast.children), 4)
+
+    def test_mixed_operators_are_not_spliced(self):
+        """Groups of a different operator stay nested."""
+        ast = parse_query("(a OR b) AND c")
+        self.assertIsInstance(ast, AndNode)
+        self.assertEqual(sorted(type(c).__name__ for c in ast.children), ["OrNode", "TextNode"])
+
+    def test_not_group_is_not_spliced(self):
+        """A negated group keeps its own node under the NOT."""
+        ast = parse_query("a AND NOT (b AND c)")
+        self.assertEqual(len(ast.children), 2)
+        self.assertIsInstance(ast.children[1], NotNode)
+        self.assertIsInstance(ast.children[1].child, AndNode)
+
+    def test_flattened_semantics(self):
+        """Flattening does not change which texts match."""
+        query = parse_query("(a AND b) AND (c OR (d OR e))")
+        self.assertTrue(apply_query(query, "a b e"))
+        self.assertFalse(apply_query(query, "a b"))
+        self.assertFalse(apply_query(query, "a c d"))
+
+
+class TestOperandReordering(unittest.TestCase):
+    """Tests for the cost-based reordering of AND/OR operands."""
+
+    def test_and_runs_substrings_before_regexes_and_groups(self):
+        """Cheap substring tests come before negations, regexes and groups."""
+        ast = parse_query('(x OR /y./) /\\d+/ NOT skip short "much longer needle"')
+        kinds = [type(c).__name__ for c in ast.children]
+        self.assertEqual(kinds, ["TextNode", "TextNode", "NotNode", "RegexNode", "OrNode"])
+        # Longer needles are more selective, so they are tried first
+        self.assertEqual(ast.children[0].value, "much longer needle")
+
+    def test_literal_only_groups_run_before_regexes(self):
+        """A group of substring tests is cheaper than a regex search."""
+        ast = parse_query("/\\d+/ (x OR y) NOT skip")
+        kinds = [type(c).__name__ for c in ast.children]
+        self.assertEqual(kinds, ["NotNode", "OrNode", "RegexNode"])
+
+    def test_or_runs_short_substrings_first(self):
+        """Shorter needles are more likely to match, so OR tries them first."""
+        ast = parse_query("/re/ OR longest OR ab")
+        self.assertEqual(repr(ast), "(Text('ab') OR Text('longest') OR Regex('re'))")
+
+    def test_equal_cost_operands_keep_query_order(self):
+        """The sort is stable for operands of the same cost."""
+        ast = parse_query("/a/ /b/ /c/")
+        self.assertEqual([c.pattern for c in ast.children], ["a", "b", "c"])
+
+    def test_reordered_groups_are_reordered_recursively(self):
+        """Nested groups are reordered too."""
+        ast = parse_query("a AND (/x/ OR b)")
+        group = ast.children[1]
+        self.assertIsInstance(group, OrNode)
+        self.assertIsInstance(group.children[0], TextNode)
+        self.assertIsInstance(group.children[1], RegexNode)
+
+    def test_cheaper_groups_run_first(self):
+        """Groups are ordered by the estimated cost of their operands."""
+        ast = parse_query("(/x+/ OR /y+/ OR /z+/) AND (a OR b) AND (c OR /w+/)")
+        self.assertEqual(
+            [sorted(repr(c) for c in group.children) for group in ast.children],
+            [["Text('a')", "Text('b')"], ["Regex('w+')", "Text('c')"],
+             ["Regex('x+')", "Regex('y+')", "Regex('z+')"]],
+        )
+
+    def test_literal_regexes_run_before_real_regexes(self):
+        """Metacharacter-free regexes are substring tests and are ordered as such."""
+        ast = parse_query("/a.c/ AND /abc/i")
+        self.assertEqual([c.pattern for c in ast.children], ["abc/i", "a.c"])
+
+    def test_prefiltered_regexes_run_before_other_regexes(self):
+        """A regex with a required literal is cheaper on texts lacking it, so it runs first."""
+        ast = parse_query("/[ab]+/ AND /\\d+@/")
+        self.assertEqual([c.pattern for c in ast.children], ["\\d+@", "[ab]+"])
+
+    def test_reordering_preserves_semantics(self):
+        """Reordering never changes which texts match."""
+        query = parse_query("/\\d{3}/ NOT error (warn OR info) service")
+        self.assertTrue(apply_query(query, "service 123 warn"))
+        self.assertFalse(apply_query(query, "service 123 warn error"))
+        self.assertFalse(apply_query(query, "service 12 info"))
+        self.assertFalse(apply_query(query, "123 info"))
+
+
+class TestConstantFolding(unittest.TestCase):
+    """Tests for folding constant subexpressions and double negations."""
+
+    TEXTS = ["python", "java", ""]
+
+    def test_empty_literal_folds_to_true(self):
+        """"" matches everything; NOT "" matches nothing."""
+        self.assertEqual(repr(parse_query('""')), "Const(True)")
+        self.assertEqual(repr(parse_query('NOT ""')), "Const(False)")
+        self.assertEqual(apply_query(parse_query('NOT ""'), self.TEXTS), [])
+        self.assertFalse(apply_query(parse_query('NOT ""'), "python"))
+        self.assertEqual(apply_query(parse_query('""'), self.TEXTS), self.TEXTS)
+
+    def test_constants_are_absorbed(self):
+        """Constants vanish from AND/OR operands or decide the node."""
+        self.assertEqual(repr(parse_query('python AND ""')), "Text('python')")
+        self.assertEqual(repr(parse_query('python OR NOT ""')), "Text('python')")
+        self.assertEqual(repr(parse_query('python AND NOT ""')), "Const(False)")
+        self.assertEqual(repr(parse_query('(a OR "") AND (b AND NOT (c OR ""))')), "Const(False)")
+
+    def test_double_negation_is_removed(self):
+        """NOT NOT x is x, however deeply nested."""
+        self.assertEqual(repr(parse_query("NOT NOT python")), "Text('python')")
+        self.assertEqual(repr(parse_query("NOT NOT NOT python")), "NOT(Text('python'))")
+        self.assertEqual(repr(parse_query("a AND NOT (NOT (b AND c))")), "(Text('a') AND Text('b') AND Text('c'))")
+
+    def test_de_morgan_removes_negations(self):
+        """A negated group of negations becomes the dual group."""
+        query = parse_query("NOT (NOT python AND NOT java)")
+        self.assertIsInstance(query, OrNode)
+        self.assertEqual(apply_query(query, self.TEXTS), ["python", "java"])
+        self.assertEqual(repr(parse_query("NOT (NOT a OR NOT b)")), "(Text('a') AND Text('b'))")
+
+
+class TestRedundantOperands(unittest.TestCase):
+    """Tests for dropping operands that cannot change a query's result."""
+
+    def test_or_keeps_shortest_of_nested_literals(self):
+        """err OR error matches exactly what err matches."""
+        query = parse_query('"err" OR error OR warn OR err')
+        self.assertEqual(repr(query), "(Text('err') OR Text('warn'))")
+        self.assertTrue(apply_query(query, "an error"))
+
+    def test_and_keeps_longest_of_nested_literals(self):
+        """py AND python matches exactly what python matches."""
+        query = parse_query("py AND python AND python")
+        self.assertEqual(repr(query), "Text('python')")
+        self.assertTrue(apply_query(query, "python"))
+        self.assertFalse(apply_query(query, "py"))
+
+    def test_duplicate_regexes_are_dropped(self):
+        """Repeated regexes are tested once; differing flags are kept."""
+        query = parse_query("/a+b/ OR x OR /a+b/ OR /a+b/i")
+        self.assertEqual(len(query.children), 3)
+
+    def test_collapsed_group_is_spliced_into_parent(self):
+        """A group reduced to one operand of the parent's kind is flattened."""
+        query = parse_query("a OR ((b OR c) AND (b OR c))")
+        self.assertIsInstance(query, OrNode)
+        self.assertEqual(sorted(repr(c) for c in query.children), ["Text('a')", "Text('b')", "Text('c')"])
+
+    def test_empty_literal_subsumes_or(self):
+        """The empty string matches every text, so an OR containing it always matches."""
+        query = parse_query('"" OR python')
+        self.assertEqual(repr(query), "Const(True)")
+        self.assertEqual(apply_query(parse_query('"" AND python'), ["python", "java"]), ["python"])
+
+
+class TestSharedOperands(unittest.TestCase):
+    """Tests for factoring operands shared by several groups out of them."""
+
+    def test_or_shared_by_and_groups_is_factored_out(self):
+        """(a OR b) AND (a OR c) tests a once."""
+        query = parse_query("(a OR b) AND (a OR c)")
+        self.assertEqual(repr(query), "(Text('a') OR (Text('b') AND Text('c')))")
+
+    def test_and_shared_by_or_groups_is_factored_out(self):
+        """(x y z) OR (x y w) OR (x q) factors x, then y among the rest."""
+        query = parse_query("(x y z) OR (x y w) OR (x q)")
+        self.assertEqual(
+            repr(query), "(Text('x') AND (Text('q') OR (Text('y') AND (Text('z') OR Text('w')))))"
+        )
+
+    def test_group_containing_a_parent_operand_is_absorbed(self):
+        """a AND (a OR b) is a, and so is a OR (a AND b)."""
+        self.assertEqual(repr(parse_query("a AND (a OR b)")), "Text('a')")
+        self.assertEqual(repr(parse_query("a OR (a AND /b+/)")), "Text('a')")
+        self.assertEqual(repr(parse_query("((a OR b) AND (a OR c)) OR (a AND z)")),
+                         "(Text('a') OR (Text('b') AND Text('c')))")
+
+    def test_factored_queries_match_the_original(self):
+        """Factoring never changes which texts match."""
+        cases = {
+            "(a OR b) AND (a OR c)": lambda t: ("a" in t or "b" in t) and ("a" in t or "c" in t),
+            "(/x\\d/ OR b) AND (/x\\d/ OR c) AND NOT d": lambda t: (
+                (re.search(r"x\d", t) or "b" in t) and (re.search(r"x\d", t) or "c" in t) and "d" not in t
+            ),
+            "(a AND b) OR (a AND c) OR (b AND c)": lambda t: (
+                ("a" in t and "b" in t) or ("a" in t and "c" in t) or ("b" in t and "c" in t)
+            ),
+        }
+        texts = ["", "a", "b", "c", "b c", "a c", "x1", "x1 b", "x1 c d", "a z"]
+        for qs, predicate in cases.items():
+            expected = [t for t in texts if predicate(t)]
+            with self.subTest(query=qs):
+                self.assertEqual(apply_query(parse_query(qs), texts), expected)
+                self.assertEqual([t for t in texts if apply_query(parse_query(qs), t)], expected)
+
+
+class TestCompiledOperands(unittest.TestCase):
+    """Tests that the compiled evaluator of AND/OR operands agrees with evaluate()."""
+
+    def test_compiled_text_operands_match_evaluate(self):
+        """Compiled sibling substring tests agree with evaluate()."""
+        queries = [
+            "alpha beta gamma",
+            "alpha OR beta OR gamma",
+            "(alpha OR beta) gamma delta NOT (x OR y)",
+            '"" OR never',
+        ]
+        texts = ["alpha beta gamma", "beta", "gamma delta alpha", "gamma delta beta x", "", "none"]
+        for qs in queries:
+            query = parse_query(qs)
+            closure = query._compile()
+            for text in texts:
+                self.assertEqual(query.evaluate(text), closure(text), msg=f"{qs!r} on {text!r}")
+
+    def test_compiled_regex_operands_match_evaluate(self):
+        """Compiled sibling regexes agree with evaluate()."""
+        queries = [
+            "/foo\\d/ OR /bar[xy]/ OR /baz+/",
+            "/\\d+/ AND /[A-Z]+/ AND /x$/",
+            "word AND (/a+/ OR /b+/) AND NOT (/c/ OR /d/)",
+        ]
+        texts = ["foo1", "bary", "bazz", "12 AB x", "12 ab x", "word aa", "word bb c", "nothing"]
+        for qs in queries:
+            query = parse_query(qs)
+            closure = query._compile()
+            for text in texts:
+                self.assertEqual(query.evaluate(text), closure(text), msg=f"{qs!r} on {text!r}")
+
+    def test_compiled_regex_operands_in_list_filtering(self):
+        """Sibling regexes filter lists correctly."""
+        query = parse_query("/^ERROR/ OR /^FATAL/")
+        self.assertEqual(
+            apply_query(query, ["ERROR x", "INFO y", "FATAL z"]),
+            ["ERROR x", "FATAL z"],
+        )
+
+    def test_ored_literals_stay_substring_tests(self):
+        """OR'd substrings are not fused into a regex, even when they start alike."""
+        query = parse_query('".com" OR ".org" OR net')
+        namespace = {}
+        self.assertEqual(query._emit(namespace), "(('net' in text) or ('.com' in text) or ('.org' in text))")
+        self.assertEqual(namespace, {})
+        self.assertEqual(
+            apply_query(query, ["a.com", "b.org", "c-org", "dnet", "x.io"]),
+            ["a.com", "b.org", "dnet"],
+        )
+
+
+class TestRegexEngines(unittest.TestCase):
+    """Tests for selecting the regex engine used by regex literals."""
+
+    def test_default_engine_is_re(self):
+        """Without an engine argument, regexes are compiled with the re module."""
+        query = parse_query("/py.*n/i")
+        self.assertIsInstance(query.regex, re.Pattern)
+
+    def test_unknown_engine_raises(self):
+        """An unsupported engine name is a QueryError."""
+        with self.assertRaises(QueryError):
+            parse_query("python", engine="pcre")
+
+    def test_identical_regexes_share_compiled_pattern(self):
+        """The same regex literal in different queries is compiled once."""
+        first = parse_query("/err(or)?/i AND disk")
+        second = parse_query("/err(or)?/i OR cpu")
+        self.assertIs(first.children[1].regex, second.children[1].regex)
+        self.assertIsNot(parse_query("/err(or)?/").regex, first.children[1].regex)
+
+    @unittest.skipIf(re2 is not None, "google-re2 is installed")
+    def test_re2_engine_requires_package(self):
+        """Requesting RE2 without the binding installed is a QueryError."""
+        with self.assertRaises(QueryError):
+            parse_query("/python/", engine="re2")
+
+    @unittest.skipUnless(re2 is not None, "google-re2 is not installed")
+    def test_re2_engine_matches(self):
+        """RE2-compiled regexes honour flags and boolean operators."""
+        query = parse_query("/^error:.*disk/im AND NOT /ignored/", engine="re2")
+        regex_node = next(c for c in query.children if isinstance(c, RegexNode))
+        self.assertNotIsInstance(regex_node.regex, re.Pattern)
+        self.assertTrue(apply_query(query, "boot ok\nERROR: Disk full"))
+        self.assertFalse(apply_query(query, "ERROR: disk full (ignored)"))
+
+    @unittest.skipUnless(re2 is not None, "google-re2 is not installed")
+    def test_re2_sibling_regexes_share_one_set_scan(self):
+        """Several RE2 regexes under one AND/OR are tested with one RE2 set."""
+        texts = ["error 12345", "error", "12345", "warn 99999 disk", ""]
+        for qs in ["/err.r/ AND /\\d{5}/", "/err.r/ OR /\\d{5}/ OR /d.sk/", "NOT (/err.r/ /\\d{5}/) AND /./"]:
+            query = parse_query(qs, engine="re2")
+            reference = parse_query(qs)
+            expected = [t for t in texts if reference.evaluate(t)]
+            self.assertEqual(apply_query(query, texts), expected, msg=qs)
+            self.assertEqual([t for t in texts if apply_query(query, t)], expected, msg=qs)
+
+        namespace = {}
+        query = parse_query("/err.r/ AND /\\d{5}/ AND /d.sk/", engine="re2")
+        self.assertEqual(query._emit(namespace), "(len(_match0(text) or ()) == 3)")
+        self.assertEqual(len(namespace), 1)
+
+    @unittest.skipUnless(re2 is not None, "google-re2 is not installed")
+    def test_re2_engine_accepts_exponential_backtracking_regexes(self):
+        """RE2 matches nested repeats in linear time, so they are not rejected."""
+        query = parse_query("/(a+)+$/", engine="re2")
+        self.assertFalse(apply_query(query, "a" * 64 + "!"))
+        self.assertTrue(apply_query(query, "aaa"))
+
+    @unittest.skipUnless(re2 is not None, "google-re2 is not installed")
+    def test_re2_regexes_are_not_prefiltered_on_literal_prefix(self):
+        """RE2 regexes that start with a literal are left to RE2's own prefix scan."""
+        query = parse_query("/token_\\d+/", engine="re2")
+        self.assertIsNone(query._required)
+        self.assertEqual(apply_query(query, ["token_12", "token_", "12"]), ["token_12"])
+
+    @unittest.skipUnless(re2 is not None, "google-re2 is not installed")
+    def test_re2_engine_follows_re2_semantics(self):
+        """Where RE2 and re disagree on a pattern, each engine gives its own result."""
+        cases = [
+            ("/x$/", "x\n"),  # RE2's $ does not match before a final newline
+            ("/^a.c$/", "abc\n"),
+            ("/@\\w+/", "xc\u00c4@\u00e4\u00c9"),  # RE2's \w is ASCII-only
+            ("/\\b\u00e9/", "\u00e9"),
+            ("/\\d/", "\u0663"),
+            ("/\\s/", "\x1c"),
+        ]
+        for qs, text in cases:
+            self.assertTrue(apply_query(parse_query(qs), text), msg=qs)
+            self.assertFalse(apply_query(parse_query(qs, engine="re2"), text), msg=qs)
+            self.assertEqual(apply_query(parse_query(qs, engine="re2"), [text]), [], msg=qs)
+        self.assertTrue(apply_query(parse_query("/x$/m", engine="re2"), "x\n"))
+
+    @unittest.skipUnless(re2 is not None, "google-re2 is not installed")
+    def test_re2_only_syntax_is_not_analysed_as_re(self):
+        """RE2 patterns such as POSIX classes are not prefiltered on what re makes of them."""
+        texts = ["abc 123", "A: x", "x\nB:", "!"]
+        cases = [
+            ("/[[:digit:]]+/", ["abc 123"]),
+            ("/[[:alpha:]]+ \\d/", ["abc 123"]),
+            ("/^[[:upper:]]:/m", ["A: x", "x\nB:"]),
+        ]
+        for qs, expected in cases:
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")  # re warns about nested sets
+                query = parse_query(qs, engine="re2")
+            self.assertIsNone(query._required, msg=qs)
+            self.assertIsNone(query._line_start, msg=qs)
+            self.assertEqual(apply_query(query, texts), expected, msg=qs)
+            self.assertEqual([t for t in texts if apply_query(query, t)], expected, msg=qs)
+
+    @unittest.skipUnless(re2 is not None, "google-re2 is not installed")
+    def test_re2_engine_falls_back_for_lookarounds(self):
+        """Patterns RE2 cannot express are compiled with re instead."""
+        query = parse_query("/^(?=.*[a-z])(?=.*\\d).{8,}$/", engine="re2")
+        self.assertIsInstance(query.regex, re.Pattern)
+        self.assertTrue(apply_query(query, "password123"))
+
+
+class TestLiteralRegexes(unittest.TestCase):
+    """Tests for regexes without metacharacters, matched as substrings."""
+
+    def test_literal_regex_matches_like_re(self):
+        """Literal regexes agree with re.search, with and without flags."""
+        texts = ["ERROR: disk", "error", "Err", "", "an eRRoR here", "stra\u00dfe ERROR"]
+        for qs, pattern, flags in [
+            ("/error/", "error", 0),
+            ("/error/i", "error", re.IGNORECASE),
+            ("/ERROR/ims", "ERROR", re.IGNORECASE | re.MULTILINE | re.DOTALL),
+        ]:
+            query = parse_query(qs)
+            expected = [t for t in texts if re.search(pattern, t, flags)]
+            self.assertEqual([t for t in texts if apply_query(query, t)], expected, msg=qs)
+            self.assertEqual(apply_query(query, texts), expected, msg=qs)
+
+    def test_case_insensitive_literal_on_non_ascii_text(self):
+        """Non-ASCII texts keep re's case folding (long s folds to s)."""
+        query = parse_query("/s/i")
+        self.assertTrue(apply_query(query, "\u017f"))
+        self.assertEqual(apply_query(query, ["\u017f", "x"]), ["\u017f"])
+
+    def test_negated_literal_regex_is_a_substring_scan(self):
+        """NOT /literal/ compiles to the same not-in test as NOT "literal"."""
+        namespace = {}
+        self.assertEqual(parse_query("NOT /error/")._emit(namespace), "('error' not in text)")
+        self.assertEqual(namespace, {})
+        self.assertEqual(apply_query(parse_query("NOT /err/"), ["error", "ok", "ERR"]), ["ok", "ERR"])
+
+    def test_several_case_insensitive_literals_share_one_lowercasing(self):
+        """Case-insensitive literals in one query agree with re on any text."""
+        texts = ["WARN: disk", "an Error", "ok", "", "ſtop WARN", "ſtop"]
+        query = parse_query("/error/i OR (/warn/i AND NOT /stop/i)")
+        expected = [
+            t for t in texts
+            if re.search("error", t, re.I) or (re.search("warn", t, re.I) and not re.search("stop", t, re.I))
+        ]
+        self.assertEqual([t for t in texts if apply_query(query, t)], expected)
+        self.assertEqual(apply_query(query, texts), expected)
+
+    def test_multiline_line_start_literal_is_two_substring_tests(self):
+        """/^[ERROR]/m is a prefix test plus a newline-prefixed substring test."""
+        query = parse_query("/^\\[ERROR\\]/m")
+        self.assertEqual(query._line_start, "[ERROR]")
+        namespace = {}
+        self.assertEqual(query._emit(namespace), "(text.startswith('[ERROR]') or '\\n[ERROR]' in text)")
+        self.assertEqual(namespace, {})
+        texts = ["[ERROR] a", "x\n[ERROR] b", "x [ERROR] c", "x\r[ERROR] d", "[ERRO"]
+        expected = [t for t in texts if re.search("^\\[ERROR\\]", t, re.M)]
+        self.assertEqual(expected, ["[ERROR] a", "x\n[ERROR] b"])
+        self.assertEqual(apply_query(query, texts), expected)
+        self.assertEqual([t for t in texts if apply_query(query, t)], expected)
+        self.assertEqual([t for t in texts if query.evaluate(t)], expected)
+
+    def test_other_anchored_patterns_keep_the_regex(self):
+        """Only case-sensitive multiline ^literal patterns are rewritten."""
+        for qs in ["/^error/", "/^error/mi", "/^err.r/m", "/^error$/m", "/\\Aerror/m"]:
+            self.assertIsNone(parse_query(qs)._line_start, msg=qs)
+        # A literal after a line anchor is still worth a prefilter
+        self.assertEqual(parse_query("/^\\[ERROR\\] \\d+/m")._required, "[ERROR] ")
+
+    def test_patterns_with_metacharacters_use_the_regex(self):
+        """Only metacharacter-free patterns are rewritten."""
+        self.assertIsNone(parse_query("/err.r/i")._literal)
+        self.assertIsNone(parse_query("/error/x")._literal)
+        self.assertEqual(parse_query("/Error/i")._literal, "error")
+
+
+class TestRequiredLiterals(unittest.TestCase):
+    """Tests for rejecting texts that lack a literal every regex match needs."""
+
+    EMAIL = "([A-Za-z0-9]+[._-])*[A-Za-z0-9]+@[A-Za-z0-9-]+(\\.[A-Za-z]{2,})"
+
+    def test_required_literal_is_extracted(self):
+        """The longest literal outside optional parts is found."""
+        self.assertEqual(parse_query(f"/{self.EMAIL}/")._required, "@")
+        self.assertEqual(parse_query("/\\d+ ERROR/")._required, " ERROR")
+        self.assertEqual(parse_query("/\\d(?:xyz)?q(ab){2,}/")._required, "ab")
+
+    def test_no_required_literal(self):
+        """Prefix literals, alternations, lookarounds and inline ignore-case are skipped."""
+        for qs in ["/ERROR \\d+/", "/\\d(ab|cd)/", "/\\d(?=abc)/", "/(?i)\\d+abc/", "/\\d(?i:abc)/", "/\\w*/"]:
+            self.assertIsNone(parse_query(qs)._required, msg=qs)
+
+    def test_case_insensitive_required_literal_is_lowercased(self):
+        """With the i flag the literal is lowercased, prefixes included, and ASCII only."""
+        self.assertEqual(parse_query("/FATAL:\\s+\\w+/i")._required, "fatal:")
+        self.assertEqual(parse_query("/\\d+ \u00e9t\u00e9 ERROR/i")._required, " error")
+        self.assertEqual(parse_query("/\\d+\u00e9t\u00e9/i")._required, "t")
+        self.assertIsNone(parse_query("/\\d+\u00e9\u00e9/i")._required)
+
+    def test_case_insensitive_prefilter_matches_like_re(self):
+        """Case folding stays re's own on non-ASCII texts (U+212A folds to k)."""
+        texts = ["FATAL: disk", "fatal:  x", "Fatal", "fatal: !", "1 K", "1 \u212a", "\u017ftop 1 k", ""]
+        for pattern in ["fatal:\\s+\\w+", "\\d+ k"]:
+            for qs in [f"/{pattern}/i", f"/{pattern}/i AND NOT /zzz\\d/i", f"/{pattern}/i OR /st.p/i"]:
+                query = parse_query(qs)
+                expected = [t for t in texts if query.evaluate(t)]
+                self.assertEqual(expected, [t for t in texts if query._closure()(t)], msg=qs)
+                self.assertEqual([t for t in texts if apply_query(query, t)], expected, msg=qs)
+                self.assertEqual(apply_query(query, texts), expected, msg=qs)
+            expected = [t for t in texts if re.search(pattern, t, re.I)]
+            self.assertEqual([t for t in texts if parse_query(f"/{pattern}/i").evaluate(t)], expected)
+
+    def test_prefiltered_regex_matches_like_re(self):
+        """Regexes with a required literal agree with re.search."""
+        texts = ["mail a.b@example.com now", "no at sign here", "@", "x@y.zz", "12 ERROR", "ERROR 12", ""]
+        for pattern in [self.EMAIL, "\\d+ ERROR", "\\s*@"]:
+            query = parse_query(f"/{pattern}/ OR zzz")
+            expected = [t for t in texts if re.search(pattern, t)]
+            self.assertEqual([t for t in texts if apply_query(query, t)], expected, msg=pattern)
+            self.assertEqual(apply_query(parse_query(f"/{pattern}/"), texts), expected, msg=pattern)
+            self.assertEqual([t for t in texts if query.evaluate(t)], expected, msg=pattern)
+
+
+class TestBatchFiltering(unittest.TestCase):
+    """Tests for evaluating a query over a whole list of texts at once."""
+
+    TEXTS = [
+        "python flask 2024",
+        "python django",
+        "ruby rails 2023",
+        "python flask",
+        "python django",
+        "",
+        "error: python crashed",
+    ]
+
+    def test_batch_matches_per_text_evaluation(self):
+        """apply_query on a list agrees with evaluating each text."""
+        queries = [
+            "python",
+            "NOT python",
+            "python flask /\\d{4}/",
+            "python AND NOT (django OR error)",
+            "ruby OR /crash/ OR flask",
+            "NOT (python AND /\\d+/)",
+            '""',
+        ]
+        for qs in queries:
+            query = parse_query(qs)
+            expected = [t for t in self.TEXTS if query.evaluate(t)]
+            self.assertEqual(apply_query(query, self.TEXTS), expected, msg=qs)
+
+    def test_batch_keeps_duplicates_and_order(self):
+        """Duplicate texts are all kept, in their original order."""
+        query = parse_query("django")
+        self.assertEqual(apply_query(query, self.TEXTS), ["python django", "python django"])
+
+    def test_batch_returns_new_list(self):
+        """The input list is never returned or modified."""
+        texts = list(self.TEXTS)
+        result = apply_query(parse_query('""'), texts)
+        self.assertEqual(result, texts)
+        self.assertIsNot(result, texts)
+        self.assertEqual(texts, self.TEXTS)
+
+    def test_batch_and_stops_when_nothing_survives(self):
+        """An AND whose first operand rejects everything yields an empty list."""
+        query = parse_query("missing AND /x{3}/")
+        self.assertEqual(apply_query(query, self.TEXTS), [])
+
+    def test_literal_only_query_uses_generated_filter(self):
+        """Literal-only trees are filtered by one generated comprehension."""
+        query = parse_query("python AND NOT (django OR error) AND (flask OR NOT ruby)")
+        batch = query._compile_filter()
+        self.assertIsNotNone(batch)
+        self.assertIs(query._compile_filter(), batch)
+        self.assertEqual(apply_query(query, self.TEXTS), ["python flask 2024", "python flask"])
+
+    def test_query_with_regex_has_no_generated_filter(self):
+        """Trees containing a regex keep the operand-by-operand filter."""
+        self.assertIsNone(parse_query("python AND (flask OR /\\d+/)")._compile_filter())
+
+
+class TestCodegen(unittest.TestCase):
+    """Tests for compiling a query AST into a single generated function."""
+
+    def test_compiled_function_is_cached(self):
+        """_compile() builds the function once per node."""
+        query = parse_query("python AND NOT /java/")
+        self.assertIs(query._compile(), query._compile())
+
+    def test_generated_function_matches_closures(self):
+        """The generated function agrees with the closure chain and evaluate()."""
+        queries = [
+            "python",
+            'NOT "two words"',
+            "a b c OR /\\d+/ NOT (x OR /y$/m)",
+            "NOT NOT (a OR NOT b)",
+            "'it\\'s' OR \"back\\\\slash\"",
+        ]
+        texts = ["python", "two words", "a b c", "42", "x", "end y", "it's", "back\\slash", ""]
+        for qs in queries:
+            query = parse_query(qs)
+            generated = query._compile()
+            closure = query._closure()
+            for text in texts:
+                self.assertEqual(generated(text), query.evaluate(text), msg=f"{qs!r} on {text!r}")
+                self.assertEqual(closure(text), query.evaluate(text), msg=f"{qs!r} on {text!r}")
+
+    def test_apply_query_on_text_returns_bool(self):
+        """apply_query on a single text returns True/False from the compiled function."""
+        query = parse_query("(python OR /j.va/) AND NOT ruby")
+        self.assertIs(apply_query(query, "python code"), True)
+        self.assertIs(apply_query(query, "java and ruby"), False)
+        self.assertIs(apply_query(parse_query("/\\d+/"), "42"), True)
+
+    def test_compile_query_returns_the_generated_function(self):
+        """compile_query() exposes the cached function apply_query runs."""
+        query = parse_query("python AND NOT javascript")
+        matches = compile_query(query)
+        self.assertIs(compile_query(query), matches)
+        self.assertIs(matches("python code"), True)
+        self.assertIs(matches("python and javascript"), False)
+        self.assertEqual([t for t in ["python", "ruby"] if matches(t)], ["python"])
+
+    def test_apply_query_iter_filters_lazily(self):
+        """apply_query_iter() consumes texts one at a time, from any iterable."""
+        query = parse_query("python AND NOT javascript")
+        consumed = []
+
+        def texts():
+            for text in ["ruby", "python code", "python and javascript", "more python"]:
+                consumed.append(text)
+                yield text
+
+        matches = apply_query_iter(query, texts())
+        self.assertEqual(consumed, [])
+        self.assertEqual(next(matches), "python code")
+        self.assertEqual(consumed, ["ruby", "python code"])
+        self.assertEqual(list(matches), ["more python"])
+        texts = ["python", "java", "jython", "python javascript"]
+        self.assertEqual(list(apply_query_iter(query, texts)), apply_query(query, texts))
+
+    def test_deeply_nested_query_is_split_into_generated_functions(self):
+        """Trees too deep for one generated expression still compile to generated code."""
+        qs = "x"
+        for i in range(100):
+            qs = f"(a{i} OR NOT ({qs} b{i}))"
+        query = parse_query(qs)
+        compiled = query._compile()
+        self.assertEqual(compiled.__name__, "_query")  # not the closure fallback
+        texts = ["x b0", "a99", "x " + " ".join(f"b{i}" for i in range(100)), ""]
+        for text in texts:
+            self.assertEqual(compiled(text), query.evaluate(text))
+
+    def test_query_nested_hundreds_of_levels_deep_can_be_applied(self):
+        """A query the parser accepts does not exceed the recursion limit when applied."""
+        qs = "x"
+        for _ in range(300):
+            qs = f"(x OR /r\\d/) AND NOT ({qs})"
+        query = parse_query(qs)
+        # Each level negates the one below it: "x" matches at even depths,
+        # "r1" at odd ones, and texts with neither never match
+        self.assertTrue(apply_query(query, "x"))
+        self.assertFalse(apply_query(query, "r1"))
+        self.assertEqual(apply_query(query, ["r1", "x", ""]), ["x"])
+
+    def test_query_nested_past_the_recursion_limit_compiles(self):
+        """Compiling a tree does not recurse once per level of nesting."""
+        levels = sys.getrecursionlimit()
+        query = TextNode("x")
+        for _ in range(levels):
+            query = AndNode((OrNode((TextNode("x"), RegexNode("r\\d"))), NotNode(query)))
+        self.assertEqual(query._compile().__name__, "_query")  # not the closure fallback
+        even = levels % 2 == 0
+        self.assertEqual(apply_query(query, "x"), even)
+        self.assertEqual(apply_query(query, "r1"), not even)
+        self.assertEqual(apply_query(query, ["r1", "x", ""]), ["x"] if even else ["r1"])
+
+
+class TestDocumentIndex(unittest.TestCase):
+    """Tests for filtering one collection of texts with many queries."""
+
+    TEXTS = [
+        "python flask 2024",
+        "python django",
+        "ruby rails 2023",
+        "python flask",
+        "",
+        "Error: python crashed",
+    ]
+
+    def test_index_matches_apply_query(self):
+        """DocumentIndex.filter agrees with apply_query, duplicates and order included."""
+        index = DocumentIndex(self.TEXTS)
+        queries = [
+            "python",
+            "NOT python",
+            "python flask /\\d{4}/",
+            "python AND NOT (django OR /error/i)",
+            "ruby OR /crash/ OR flask",
+            "NOT (python AND /\\d+/)",
+            "zzz",
+        ]
+        for qs in queries:
+            query = parse_query(qs)
+            self.assertEqual(index.filter(query), apply_query(query, self.TEXTS), msg=qs)
+
+    def test_terms_are_scanned_once(self):
+        """A term seen by an earlier query is not matched against the texts again."""
+        index = DocumentIndex(self.TEXTS)
+        index.filter(parse_query("python AND flask"))
+        with mock.patch.object(TextNode, "_compile", side_effect=AssertionError("rescanned")):
+            self.assertEqual(index.filter(parse_query("flask OR NOT python")), [
+                "python flask 2024", "ruby rails 2023", "python flask", "",
+            ])
+
+    def test_empty_index(self):
+        """An empty collection matches nothing."""
+        self.assertEqual(DocumentIndex([]).filter(parse_query("NOT python")), [])
+
+    @unittest.skipUnless(re2 is not None, "google-re2 is not installed")
+    def test_regex_terms_are_remembered_per_engine(self):
+        """The same regex under re and RE2 is two terms, as the engines can disagree."""
+        texts = ["café", "cafe", "٣"]
+        index = DocumentIndex(texts)
+        for qs in ["/^\\w+$/", "/\\d/"]:
+            for engine in ["re", "re2", "re"]:
+                query = parse_query(qs, engine=engine)
+                self.assertEqual(index.filter(query), apply_query(query, texts), msg=(qs, engine))
+
+
 if __name__ == "__main__":
     unittest.main()
 